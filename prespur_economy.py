@@ -1,17 +1,30 @@
 # =========================================================
 # prespur_economy_with_reasons.py
 # Ilha Prespur realm-economy simulator with probabilistic boom/slump reasons
+# Standard library only, so it runs unchanged on PyPy: pypy3 prespur_economy.py
 # =========================================================
+import functools
 import random
-import logging
+import sys
+from array import array
 from dataclasses import dataclass
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Tuple
 
 # ---------- Constants & Configuration ----------
 DIE_LADDER = ["d0", "d2", "d4", "d6", "d8", "d10", "d12"]
+_DIE_SET = frozenset(DIE_LADDER)
+_DIE_INDEX = {code: i for i, code in enumerate(DIE_LADDER)}  # ladder position per die code
+_DIE_TOP = len(DIE_LADDER) - 1
+_DIE_SIDES = tuple(int(code[1:]) for code in DIE_LADDER)  # sides per ladder position
+_DIE_SIZE = dict(zip(DIE_LADDER, _DIE_SIDES))  # sides per die code
+# Ladder position after one step up/down, clamped at the ends
+_STEP_UP = tuple(min(i + 1, _DIE_TOP) for i in range(len(DIE_LADDER)))
+_STEP_DOWN = tuple(max(i - 1, 0) for i in range(len(DIE_LADDER)))
 GP_PER_EXPORT_STEP = 5  # this changes how much exports are worth per dice and changes flat rev!
 LOYALTY_GROWTH_FACTOR = 0.05
 TARIFF_RATE = 1  # % tariff on all imports
+_TARIFF_MULT = TARIFF_RATE / 100
+FLAT_REVENUE_KEYS = ("other_income", "luxury_tax", "gate_fees")  # revenue counted as flat income
 
 BOOM_THRESHOLD = 7
 SLUMP_THRESHOLD = 5
@@ -24,7 +37,7 @@ R_RANGE = 0.1
 ECON_BIAS = 0
 
 # Narrative reasons for booms and slumps
-REASONS_BOOM = [
+REASONS_BOOM = (
     "surge in overseas demand",
     "new trade treaty signed with a wealthy ally",
     "bountiful harvest season",
@@ -42,8 +55,8 @@ REASONS_BOOM = [
     "farmers plant by moonlight under a druid's guidance, yielding a bumper crop.",
     "meelon musk attempted to send a rock into space using a peasant railgun. this excited the markets, and they threw their hearts out to him",
     "banks are handing out frivolous loans. this surely can't go wrong!"
-]
-REASONS_SLUMP = [
+)
+REASONS_SLUMP = (
     "poor harvest season",
     "pirate raids disrupted merchant routes",
     "outbreak of livestock disease",
@@ -61,8 +74,12 @@ REASONS_SLUMP = [
     "don't ask me. i just work here.",
     "coronation street was on, so everyone decided to take the day off.",
     "Just Stop Peat protesters tied themselves to a trade ship's mast and disrupted its schedule."
-]
+)
+N_BOOM = len(REASONS_BOOM)
+N_SLUMP = len(REASONS_SLUMP)
 
+# Foreign sales read tables derived from NEIGHBOURS; after editing it directly,
+# call refresh_neighbours() (add_neighbour does this for you)
 NEIGHBOURS = {
     "Cormyr": {"pop": 4, "rel": 1, "dist": 5,
                "scarcity": {"fish": 0.5, "timber": 1, "salt": 1}},
@@ -72,16 +89,8 @@ NEIGHBOURS = {
                      "scarcity": {"fish": 0, "timber": 2, "salt": 0}}
 }
 
-# Setup Logging
-logger = logging.getLogger(__name__)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(levelname)s: %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
-
 # Data Class
-@dataclass
+@dataclass(slots=True)
 class EconomyState:
     trade_die: str
     agri_die: str
@@ -96,58 +105,182 @@ class EconomyState:
     total_import_value: int = 0  # To track imports for tariffs
 
     def validate(self):
-        for die in [self.trade_die, self.agri_die] + list(self.exports.values()):
-            if die not in DIE_LADDER:
+        for die in (self.trade_die, self.agri_die, *self.exports.values()):
+            if die not in _DIE_SET:
                 raise ValueError(f"Invalid die code: {die}")
-        for val in list(self.revenue.values()) + list(self.costs.values()):
+        for val in (*self.revenue.values(), *self.costs.values()):
             if not isinstance(val, int) or val < 0:
                 raise ValueError("Revenue/cost values must be non-negative ints.")
         if self.import_penalties < 0 or self.upkeep < 0:
             raise ValueError("Import penalties and upkeep must be non-negative.")
         if not (0 <= self.loyalty_tier <= 5):
             raise ValueError("Loyalty tier must be between 0 and 5.")
-        if self.treasury < 0:
-            raise ValueError("Treasury cannot be negative.")
         if self.total_import_value < 0:
             raise ValueError("Total import value cannot be negative.")
 
 # Helper Functions
 
+_getrandbits = random.getrandbits
+
+def _bounded(n: int) -> int:
+    """Uniform int in [0, n) for 0 < n < 2**32 (Lemire's multiply-shift with rejection)."""
+    m = _getrandbits(32) * n
+    if (m & 0xFFFFFFFF) < n:
+        threshold = (0x100000000 - n) % n
+        while (m & 0xFFFFFFFF) < threshold:
+            m = _getrandbits(32) * n
+    return m >> 32
+
+def _roll(sides: int) -> int:
+    return _bounded(sides) + 1 if sides else 0  # a d0 never pays out
+
 def roll_die(code: str) -> int:
-    return random.randint(1, int(code[1:]))
+    return _roll(die_size(code))
 
 def die_size(code: str) -> int:
-    return int(code[1:])
+    # Ladder dice come from the table; any other dN (e.g. d20) is parsed
+    sides = _DIE_SIZE.get(code)
+    return int(code[1:]) if sides is None else sides
 
 def avg_export_size(exports: Dict[str, str]) -> float:
     if not exports:
         return 0.0
-    return sum(die_size(d) for d in exports.values()) / len(exports)
+    return sum(map(die_size, exports.values())) / len(exports)
 
-def growth_modifier(exports: Dict[str, str]) -> float:
-    avg_ei = round(avg_export_size(exports))
+def _growth_for(avg_ei: int) -> float:
     return max(-0.20, min(0.20, (avg_ei - 6) / 20.0))
 
+def growth_modifier(exports: Dict[str, str]) -> float:
+    return _growth_for(round(avg_export_size(exports)))
+
 def random_variance() -> float:
     return random.uniform(-R_RANGE, R_RANGE) + ECON_BIAS
 
+def _step(idx: int, up: bool) -> int:
+    return (_STEP_UP if up else _STEP_DOWN)[idx]
+
 def step_die(code: str, up: bool = True) -> str:
-    idx = DIE_LADDER.index(code)
-    idx = max(0, min(idx + (1 if up else -1), len(DIE_LADDER) - 1))
-    return DIE_LADDER[idx]
+    return DIE_LADDER[_step(_DIE_INDEX[code], up)]
 
 def demand_score(pop: int, scar: int, rel: int, dist: int) -> int:
     return max(0, (pop + scar + rel) - dist)
 
+def _demand_weights():
+    """Sum every neighbour's demand score per commodity, once per change to NEIGHBOURS."""
+    base = sum(demand_score(d['pop'], 0, d['rel'], d['dist']) for d in NEIGHBOURS.values())
+    comms = {comm for d in NEIGHBOURS.values() for comm in d['scarcity']}
+    weights = {comm: sum(demand_score(d['pop'], d['scarcity'].get(comm, 0), d['rel'], d['dist'])
+                         for d in NEIGHBOURS.values())
+               for comm in comms}
+    return weights, base
+
+# Commodities no neighbour lists as scarce all share the base weight
+_DEMAND_WEIGHTS, _BASE_DEMAND = _demand_weights()
+
 def foreign_sales(exports: Dict[str, str]) -> int:
-    gp = 0
-    for data in NEIGHBOURS.values():
-        for comm, die in exports.items():
-            scar = data['scarcity'].get(comm, 0)
-            score = demand_score(data['pop'], scar, data['rel'], data['dist'])
-            if score > 0:
-                gp += score * die_size(die) * GP_PER_EXPORT_STEP
-    return gp
+    weight = _DEMAND_WEIGHTS.get
+    size = die_size
+    base = _BASE_DEMAND
+    gp = sum(weight(comm, base) * size(die) for comm, die in exports.items())
+    # Scarcities can be fractional (see add_neighbour), so round to whole gp
+    return round(gp * GP_PER_EXPORT_STEP)
+
+# Flat-list ("struct of arrays") versions of the export helpers. Exports are
+# held as a list of ladder indices in the order of the state's exports dict.
+
+def _trend(export_idx: List[int]) -> Tuple[int, float]:
+    """Return the rounded average export die size and this month's trend."""
+    avg_ei = round(sum(map(_DIE_SIDES.__getitem__, export_idx)) / len(export_idx)) if export_idx else 0
+    return avg_ei, _growth_for(avg_ei) + (random.uniform(-R_RANGE, R_RANGE) + ECON_BIAS)
+
+@functools.lru_cache(maxsize=None)
+def _foreign_sales_for(names: Tuple[str, ...]) -> Callable[[List[int]], int]:
+    """Generate foreign_sales unrolled over exports ``names``, in that order."""
+    terms = []
+    for i, name in enumerate(names):
+        weight = _DEMAND_WEIGHTS.get(name, _BASE_DEMAND)
+        if weight:
+            terms.append(f"{weight!r} * sides[export_idx[{i}]]")
+    # Weights are baked in (add_neighbour/refresh_neighbours clear this cache);
+    # GP_PER_EXPORT_STEP is read from the module at call time
+    src = (f"def foreign_sales(export_idx, sides=_DIE_SIDES):\n"
+           f"    return round(({' + '.join(terms) or '0'}) * GP_PER_EXPORT_STEP)\n")
+    namespace = {}
+    exec(compile(src, "<foreign_sales>", "exec"), globals(), namespace)
+    return namespace["foreign_sales"]
+
+def add_neighbour(name: str, pop: int, rel: int, dist: int,
+                  scarcity: Optional[Dict[str, float]] = None) -> None:
+    """Add or replace a trading neighbour and rebuild the foreign demand tables."""
+    NEIGHBOURS[name] = {"pop": pop, "rel": rel, "dist": dist, "scarcity": dict(scarcity or {})}
+    refresh_neighbours()
+
+def refresh_neighbours() -> None:
+    """Rebuild the foreign demand tables after NEIGHBOURS has been edited."""
+    global _DEMAND_WEIGHTS, _BASE_DEMAND
+    _DEMAND_WEIGHTS, _BASE_DEMAND = _demand_weights()
+    _foreign_sales_for.cache_clear()
+
+def _ladder_index(code: str) -> int:
+    try:
+        return _DIE_INDEX[code]
+    except KeyError:
+        raise ValueError(f"Invalid die code: {code}") from None
+
+def _pack(state: EconomyState) -> Tuple:
+    """Flatten ``state`` into the kernel's die indices, export list and fixed monthly totals."""
+    trade_idx = _ladder_index(state.trade_die)
+    agri_idx = _ladder_index(state.agri_die)
+    names = list(state.exports)
+    export_idx = [_ladder_index(state.exports[n]) for n in names]
+    sales = _foreign_sales_for(tuple(names))
+    exp_gp = sum(state.export_quantities.get(n, 0) * GP_PER_EXPORT_STEP for n in names)
+    flat_rev = sum(state.revenue.get(k, 0) for k in FLAT_REVENUE_KEYS)
+    fixed_out = sum(state.costs.values()) + state.import_penalties + state.upkeep
+    return trade_idx, agri_idx, names, export_idx, sales, exp_gp, flat_rev, fixed_out
+
+def _month_kernel(trade_idx: int, agri_idx: int, export_idx: List[int], sales: Callable[[List[int]], int],
+                  exp_gp: int, flat_rev: int, fixed_out: int, loyalty_tier: int) -> Tuple:
+    """Roll one month on flat values, stepping ``export_idx`` in place; returns the month's figures."""
+    # Roll core dice
+    bounded = _bounded
+    t_sides = _DIE_SIDES[trade_idx]
+    a_sides = _DIE_SIDES[agri_idx]
+    t_roll = bounded(t_sides) + 1 if t_sides else 0
+    a_roll = bounded(a_sides) + 1 if a_sides else 0
+    trade_gp = 25 * t_roll
+    agri_gp = 10 * a_roll
+    foreign_gp = sales(export_idx)
+
+    # Calculate potential tariff (assuming a fixed import value for simplicity here)
+    # In a more complex model, this would be based on actual imported goods and their value.
+    # For this example, we'll use a fixed percentage of this month's gross income.
+    gross = trade_gp + agri_gp + flat_rev + exp_gp + foreign_gp
+    tariff = round(gross * _TARIFF_MULT)
+
+    # Totals & profit
+    raw = gross - fixed_out
+    avg_ei, trend = _trend(export_idx)  # avg_ei also feeds the hard thresholds below
+    profit = round(raw * (1 + LOYALTY_GROWTH_FACTOR * loyalty_tier + trend))
+
+    # Determine boom/slump probabilistically, falling back to hard thresholds
+    # if rarely triggered
+    boom = trend >= TREND_BOOM_TRIGGER or avg_ei >= BOOM_THRESHOLD
+    slump = trend <= TREND_SLUMP_TRIGGER or avg_ei <= SLUMP_THRESHOLD
+
+    # +1 on a boom, -1 on a slump, 0 otherwise; a boom wins when both trigger
+    delta = boom - (slump > boom)
+    if delta:
+        # A boom lifts the weakest export, a slump cuts the strongest. Ladder
+        # order matches die size, so min/max on indices picks the same export.
+        pick, stepped = (min, _STEP_UP) if delta > 0 else (max, _STEP_DOWN)
+        if export_idx:
+            i = pick(range(len(export_idx)), key=export_idx.__getitem__)
+            export_idx[i] = stepped[export_idx[i]]
+        trade_idx = stepped[trade_idx]
+
+    return (t_roll, a_roll, trade_gp, agri_gp, foreign_gp, tariff, raw, trend,
+            profit, boom, slump, trade_idx)
 
 # Simulator
 class EconomySimulator:
@@ -155,83 +288,79 @@ class EconomySimulator:
         if seed is not None:
             random.seed(seed)
 
-    def simulate_month(self, state: EconomyState, verbose: bool = True) -> EconomyState:
-        state.validate()
-        # Roll core dice
-        t_roll = roll_die(state.trade_die)
-        a_roll = roll_die(state.agri_die)
-        trade_gp = 25 * t_roll
-        agri_gp = 10 * a_roll
-
-        # Calculate export revenue based on quantities and GP_PER_EXPORT_STEP
-        exp_gp = sum(state.export_quantities.get(item, 0) * GP_PER_EXPORT_STEP for item in state.exports)
-        foreign_gp = foreign_sales(state.exports)
-        state.revenue['foreign_sales'] = foreign_gp
+    def simulate_month(self, state: EconomyState, verbose: bool = True,
+                       validate: bool = False) -> EconomyState:
+        """Advance ``state`` one month in place; a negative treasury is debt, not an error."""
+        if validate:
+            state.validate()
+        trade_idx, agri_idx, names, export_idx, sales, exp_gp, flat_rev, fixed_out = _pack(state)
+        (t_roll, a_roll, trade_gp, agri_gp, foreign_gp, potential_tariff, raw, trend,
+         profit, boom, slump, trade_idx) = _month_kernel(
+            trade_idx, agri_idx, export_idx, sales, exp_gp, flat_rev, fixed_out, state.loyalty_tier)
 
-        # Calculate potential tariff (assuming a fixed import value for simplicity here)
-        # In a more complex model, this would be based on actual imported goods and their value.
-        # For this example, we'll use a fixed percentage of the total revenue.
-        potential_tariff = round((trade_gp + agri_gp + sum(state.revenue.values()) + exp_gp + foreign_gp) * (TARIFF_RATE / 100))
+        # Write the month back into the state
+        state.revenue['foreign_sales'] = foreign_gp
         state.revenue['trade_tariff'] = potential_tariff
-        outflows = sum(state.costs.values()) + state.import_penalties + state.upkeep + potential_tariff # Tariffs are an outflow
-
-        # Totals & profit
-        flat_rev = state.revenue.get('other_income', 0) + state.revenue.get('luxury_tax', 0) + state.revenue.get('gate_fees', 0)
-        raw = trade_gp + agri_gp + flat_rev + exp_gp + foreign_gp - (sum(state.costs.values()) + state.import_penalties + state.upkeep)
-        trend = growth_modifier(state.exports) + random_variance()
-        profit = round(raw * (1 + LOYALTY_GROWTH_FACTOR * state.loyalty_tier + trend))
         state.treasury += profit
-
-        # Determine boom/slump probabilistically
-        boom = trend >= TREND_BOOM_TRIGGER
-        slump = trend <= TREND_SLUMP_TRIGGER
-        # Fall back to hard thresholds if rarely triggered
-        avg_ei = round(avg_export_size(state.exports))
-        if not boom and avg_ei >= BOOM_THRESHOLD:
-            boom = True
-        if not slump and avg_ei <= SLUMP_THRESHOLD:
-            slump = True
+        state.trade_die = DIE_LADDER[trade_idx]
+        for name, idx in zip(names, export_idx):
+            state.exports[name] = DIE_LADDER[idx]
 
         reason = None
         if boom:
-            if state.exports:
-                worst = min(state.exports, key=lambda k: die_size(state.exports[k]))
-                state.exports[worst] = step_die(state.exports[worst], up=True)
-            state.trade_die = step_die(state.trade_die, up=True)
-            reason = random.choice(REASONS_BOOM)
+            reason = REASONS_BOOM[_bounded(N_BOOM)]
         elif slump:
-            if state.exports:
-                best = max(state.exports, key=lambda k: die_size(state.exports[k]))
-                state.exports[best] = step_die(state.exports[best], up=False)
-            state.trade_die = step_die(state.trade_die, up=False)
-            reason = random.choice(REASONS_SLUMP)
+            reason = REASONS_SLUMP[_bounded(N_SLUMP)]
 
-        # Verbose output
+        # Verbose output, written in one go
         if verbose:
-            print("-- Inflows --")
-            print(f"  Trade     : +{trade_gp} gp (25×{t_roll})")
-            print(f"  Agri      : +{agri_gp} gp (10×{a_roll})")
-            print(f"  Flat Rev  : +{flat_rev} gp")
+            lines = [
+                "-- Inflows --",
+                f"  Trade     : +{trade_gp} gp (25×{t_roll})",
+                f"  Agri      : +{agri_gp} gp (10×{a_roll})",
+                f"  Flat Rev  : +{flat_rev} gp",
+            ]
             if exp_gp:
-                print(f"  Exports   : +{exp_gp} gp")
-            print(f"  Foreign   : +{foreign_gp} gp")
-            print("-- Outflows --")
-            for name, cost in state.costs.items():
-                print(f"  {name:12}: -{cost} gp")
-            print(f"  Imports   : -{state.import_penalties} gp")
-            print(f"  Upkeep    : -{state.upkeep} gp")
-            print(f"  Tariffs   : -{potential_tariff} gp")
-            print(f"Raw Income  : {raw:+} gp")
-            print(f"Trend Score : {trend:.2f} (growth+rand)")
-            print(f"Net Profit  : {profit:+} gp   -> Treasury {state.treasury} gp")
+                lines.append(f"  Exports   : +{exp_gp} gp")
+            lines.append(f"  Foreign   : +{foreign_gp} gp")
+            lines.append("-- Outflows --")
+            lines.extend(f"  {name:12}: -{cost} gp" for name, cost in state.costs.items())
+            lines += [
+                f"  Imports   : -{state.import_penalties} gp",
+                f"  Upkeep    : -{state.upkeep} gp",
+                f"  Tariffs   : -{potential_tariff} gp",
+                f"Raw Income  : {raw:+} gp",
+                f"Trend Score : {trend:.2f} (growth+rand)",
+                f"Net Profit  : {profit:+} gp   -> Treasury {state.treasury} gp",
+            ]
             if boom or slump:
                 label = 'Boom reason' if boom else 'Slump reason'
-                print(f"{label:14}: {reason.capitalize()}")
+                lines.append(f"{label:14}: {reason.capitalize()}")
             else:
-                print("No boom or slump this month.")
+                lines.append("No boom or slump this month.")
+            sys.stdout.write("\n".join(lines) + "\n")
 
         return state
 
+    def run_campaign(self, state: EconomyState, months: int, trials: int = 1) -> array:
+        """Run ``trials`` copies of ``state`` for ``months`` months; returns final treasuries as array('q')."""
+        state.validate()
+        trade_idx0, agri_idx, _, export_idx0, sales, exp_gp, flat_rev, fixed_out = _pack(state)
+        kernel = _month_kernel
+        results = array('q')
+        export_idx = list(export_idx0)  # scratch, reset for every trial
+        for _ in range(trials):
+            export_idx[:] = export_idx0
+            trade_idx = trade_idx0
+            treasury = state.treasury
+            for _ in range(months):
+                month = kernel(trade_idx, agri_idx, export_idx, sales, exp_gp, flat_rev,
+                               fixed_out, state.loyalty_tier)
+                treasury += month[8]
+                trade_idx = month[11]
+            results.append(treasury)
+        return results
+
 if __name__ == "__main__":
     initial = EconomyState(
         trade_die="d6",
@@ -248,7 +377,7 @@ if __name__ == "__main__":
     )
 
     sim = EconomySimulator()
-    result = sim.simulate_month(initial, verbose=True)
+    result = sim.simulate_month(initial, verbose=True, validate=True)
 
     # total exports
     exp_gp = sum(result.export_quantities.get(item, 0) * GP_PER_EXPORT_STEP for item in result.exports)
@@ -0,0 +1,180 @@
+import copy
+import io
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+import prespur_economy as pe
+
+COMMODITIES = ("fish", "timber", "salt", "olives", "wine", "grain", "amber")
+
+
+def make_state(**overrides):
+    fields = dict(
+        trade_die="d6",
+        agri_die="d6",
+        exports={"fish": "d4", "timber": "d4", "salt": "d0", "olives": "d2", "wine": "d2", "grain": "d8"},
+        revenue={"trade_tariff": 0, "luxury_tax": 5, "gate_fees": 0, "other_income": 300},
+        export_quantities={"fish": 2, "timber": 2, "salt": 0, "olives": 1, "wine": 1, "grain": 3},
+        costs={"festival_grant": 75, "road_levy": 0, "bounties": 5},
+        import_penalties=300,
+        upkeep=400,
+        loyalty_tier=0,
+        treasury=1000,
+    )
+    fields.update(overrides)
+    return pe.EconomyState(**fields)
+
+
+def random_state(rng):
+    # Baseline randint crashed on a d0 trade/agri die, so keep those on d2+
+    names = rng.sample(COMMODITIES, rng.randint(0, len(COMMODITIES)))
+    return make_state(
+        trade_die=rng.choice(pe.DIE_LADDER[1:]),
+        agri_die=rng.choice(pe.DIE_LADDER[1:]),
+        exports={n: rng.choice(pe.DIE_LADDER) for n in names},
+        revenue={k: rng.randint(0, 400) for k in pe.FLAT_REVENUE_KEYS},
+        export_quantities={n: rng.randint(0, 5) for n in names},
+        costs={"festival_grant": rng.randint(0, 200), "bounties": rng.randint(0, 50)},
+        import_penalties=rng.randint(0, 400),
+        upkeep=rng.randint(0, 500),
+        loyalty_tier=rng.randint(0, 5),
+        treasury=rng.randint(-2000, 5000),
+    )
+
+
+def baseline_foreign_sales(exports):
+    gp = 0
+    for data in pe.NEIGHBOURS.values():
+        for comm, die in exports.items():
+            score = max(0, data["pop"] + data["scarcity"].get(comm, 0) + data["rel"] - data["dist"])
+            if score > 0:
+                gp += score * int(die[1:]) * pe.GP_PER_EXPORT_STEP
+    return gp
+
+
+def baseline_month(state):
+    # The baseline simulate_month, with the tariff based on this month's gross income
+    size = lambda code: int(code[1:])
+    step = lambda code, up: pe.DIE_LADDER[max(0, min(pe.DIE_LADDER.index(code) + (1 if up else -1), 6))]
+    trade_gp = 25 * random.randint(1, size(state.trade_die))
+    agri_gp = 10 * random.randint(1, size(state.agri_die))
+    exp_gp = sum(state.export_quantities.get(i, 0) * pe.GP_PER_EXPORT_STEP for i in state.exports)
+    foreign_gp = baseline_foreign_sales(state.exports)
+    flat_rev = sum(state.revenue.get(k, 0) for k in pe.FLAT_REVENUE_KEYS)
+    tariff = round((trade_gp + agri_gp + flat_rev + exp_gp + foreign_gp) * (pe.TARIFF_RATE / 100))
+    raw = trade_gp + agri_gp + flat_rev + exp_gp + foreign_gp - (
+        sum(state.costs.values()) + state.import_penalties + state.upkeep)
+    avg = sum(size(d) for d in state.exports.values()) / len(state.exports) if state.exports else 0.0
+    trend = max(-0.20, min(0.20, (round(avg) - 6) / 20.0)) + (random.uniform(-pe.R_RANGE, pe.R_RANGE) + pe.ECON_BIAS)
+    profit = round(raw * (1 + pe.LOYALTY_GROWTH_FACTOR * state.loyalty_tier + trend))
+    boom = trend >= pe.TREND_BOOM_TRIGGER or round(avg) >= pe.BOOM_THRESHOLD
+    slump = trend <= pe.TREND_SLUMP_TRIGGER or round(avg) <= pe.SLUMP_THRESHOLD
+    exports = dict(state.exports)
+    if boom or slump:
+        if exports:
+            pick = min if boom else max
+            name = pick(exports, key=lambda k: size(exports[k]))
+            exports[name] = step(exports[name], boom)
+        trade_die = step(state.trade_die, boom)
+        random.choice(pe.REASONS_BOOM if boom else pe.REASONS_SLUMP)
+    else:
+        trade_die = state.trade_die
+    return state.treasury + profit, trade_die, exports, foreign_gp, tariff
+
+
+def test_simulate_month_matches_baseline(monkeypatch):
+    # randint/choice draw through _randbelow; use it so both sides consume the same stream
+    monkeypatch.setattr(pe, "_bounded", random._inst._randbelow)
+    rng = random.Random(1234)
+    sim = pe.EconomySimulator()
+    for seed in range(3000):
+        state = random_state(rng)
+        random.seed(seed)
+        expected = baseline_month(copy.deepcopy(state))
+        random.seed(seed)
+        sim.simulate_month(state, verbose=False)
+        got = (state.treasury, state.trade_die, state.exports,
+               state.revenue["foreign_sales"], state.revenue["trade_tariff"])
+        assert got == expected, seed
+
+
+def test_roll_die_d0_pays_nothing():
+    assert pe.roll_die("d0") == 0
+    assert 1 <= pe.roll_die("d20") <= 20
+
+
+def test_two_month_chain():
+    state = make_state()
+    sim = pe.EconomySimulator(seed=7)
+    with redirect_stdout(io.StringIO()):
+        sim.simulate_month(state, validate=True)
+        sim.simulate_month(state, validate=True)
+    assert isinstance(state.revenue["foreign_sales"], int)
+
+
+def test_debt_is_a_valid_state():
+    state = make_state(treasury=-500)
+    state.validate()
+    assert len(pe.EconomySimulator(seed=1).run_campaign(state, 3, 2)) == 2
+
+
+def test_tariff_is_a_share_of_gross_income(monkeypatch):
+    monkeypatch.setattr(pe, "_bounded", lambda n: n - 1)  # every die rolls its maximum
+    state = make_state(trade_die="d8", agri_die="d4")
+    pe.EconomySimulator().simulate_month(state, verbose=False)
+    gross = 25 * 8 + 10 * 4 + 305 + 45 + 370
+    assert state.revenue["foreign_sales"] == 370
+    assert state.revenue["trade_tariff"] == round(gross * pe.TARIFF_RATE / 100)
+
+
+def test_run_campaign_returns_int64_per_trial():
+    state = make_state()
+    before = copy.deepcopy(state)
+    results = pe.EconomySimulator(seed=3).run_campaign(state, months=12, trials=25)
+    assert len(results) == 25
+    assert results.typecode == "q"
+    assert state == before
+
+
+def test_invalid_die_raises_value_error():
+    with pytest.raises(ValueError, match="Invalid die code: d20"):
+        pe.EconomySimulator().simulate_month(make_state(trade_die="d20"), verbose=False)
+
+
+@pytest.fixture
+def neighbours():
+    saved = copy.deepcopy(pe.NEIGHBOURS)
+    yield pe.NEIGHBOURS
+    pe.NEIGHBOURS.clear()
+    pe.NEIGHBOURS.update(saved)
+    pe.refresh_neighbours()
+
+
+def generated_sales(exports):
+    names = tuple(exports)
+    return pe._foreign_sales_for(names)([pe._DIE_INDEX[exports[n]] for n in names])
+
+
+def test_add_neighbour_rebuilds_demand(neighbours):
+    exports = make_state(exports={"fish": "d2", "wine": "d4"}).exports
+    before = generated_sales(exports)
+    pe.add_neighbour("Waterdeep", 5, 1, 2, {"wine": 2, "fish": 0.05})
+    expected = round(baseline_foreign_sales(exports))
+    assert expected != before
+    assert pe.foreign_sales(exports) == generated_sales(exports) == expected
+
+
+def test_refresh_neighbours_after_direct_edit(neighbours):
+    exports = {"timber": "d8"}
+    neighbours["Sembia"]["rel"] = 5
+    pe.refresh_neighbours()
+    assert pe.foreign_sales(exports) == generated_sales(exports) == baseline_foreign_sales(exports)
+
+
+def test_generated_sales_follow_gp_per_export_step(monkeypatch):
+    exports = {"timber": "d8"}
+    generated_sales(exports)  # cache the generated function at the default rate
+    monkeypatch.setattr(pe, "GP_PER_EXPORT_STEP", 10)
+    assert generated_sales(exports) == pe.foreign_sales(exports) == baseline_foreign_sales(exports)